@@ -2,84 +2,158 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import openpyxl
-from io import StringIO
+from io import StringIO, BytesIO
+import re
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 금액 컬럼 저장 정밀도 ('float32' 선택 시 값 손실 없이 변환되는 컬럼만 float32로 저장해
+# 메모리 사용량을 절반으로 줄임; 집계/비교는 항상 float64로 계산)
+PRECISION = 'float64'
+
 st.set_page_config(
     page_title="회계감사 JET 자동화 프로그램",
     page_icon="📊",
     layout="wide"
 )
 
-def load_data_file(uploaded_file):
-    """파일 업로드 및 데이터 로딩 함수"""
+def _read_csv_pyarrow(file_bytes):
+    """UTF-8 CSV를 PyArrow로 파싱 (날짜/시각으로 추론되는 컬럼은 C 엔진과 같이 원본 문자열 유지)"""
+    # 타입 추론은 첫 블록 기준이므로 스트리밍 리더의 스키마로 날짜 컬럼을 미리 확인
+    schema = pa_csv.open_csv(BytesIO(file_bytes)).schema
+    convert_options = pa_csv.ConvertOptions(
+        column_types={field.name: pa.string() for field in schema if pa.types.is_temporal(field.type)},
+        strings_can_be_null=True,
+    )
+    return pa_csv.read_csv(BytesIO(file_bytes), convert_options=convert_options).to_pandas()
+
+def dataframe_digest(df):
+    """DataFrame 내용 기반 해시값 (시나리오 결과 캐시 키)"""
+    if df is None:
+        return None
+    # 행 해시는 값만 반영하므로 컬럼명/순서와 dtype을 함께 키에 포함
+    # (예: 차변금액/대변금액 헤더가 뒤바뀐 파일과 구분)
+    return (
+        tuple(df.columns),
+        tuple(map(str, df.dtypes)),
+        int(pd.util.hash_pandas_object(df, index=True).sum()),
+    )
+
+def _to_amount_dtype(values):
+    """금액 컬럼을 PRECISION 설정 dtype으로 변환 (float32는 값 손실이 없는 경우에만 적용)"""
+    values = values.astype(np.float64)
+    if PRECISION == 'float32':
+        # float32는 2^24(약 1,677만원)를 넘는 금액을 원 단위로 정확히 표현하지 못함
+        downcast = values.astype(np.float32)
+        if (downcast.astype(np.float64) == values).all():
+            return downcast
+    return values
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_data_impl(file_bytes, filename):
+    """업로드 파일 내용 기준으로 캐시되는 데이터 로딩 함수 (위젯 변경 시 재파싱 방지)
+    
+    로딩된 DataFrame과 내용 해시값(시나리오 결과 캐시 키)을 함께 반환
+    """
     try:
-        if uploaded_file.name.endswith('.csv'):
-            # 파일 포인터를 처음으로 리셋
-            uploaded_file.seek(0)
-            
-            # 다양한 인코딩 시도
-            encodings = ['cp949', 'euc-kr', 'utf-8', 'utf-8-sig', 'ansi']
+        if filename.endswith('.csv'):
             df = None
             successful_encoding = None
             
-            for encoding in encodings:
+            # UTF-8 파일은 PyArrow로 한 번에 파싱 (멀티스레드)
+            if PYARROW_AVAILABLE:
                 try:
-                    uploaded_file.seek(0)  # 각 시도마다 파일 포인터 리셋
-                    df = pd.read_csv(uploaded_file, encoding=encoding)
-                    successful_encoding = encoding
-                    # 컬럼이 제대로 파싱되었는지 확인
-                    if len(df.columns) > 0 and not df.empty:
-                        break
-                except (UnicodeDecodeError, pd.errors.EmptyDataError, pd.errors.ParserError):
-                    continue
+                    df = _read_csv_pyarrow(file_bytes)
+                    successful_encoding = 'utf-8 (pyarrow)'
+                except (pa.ArrowException, ValueError):
+                    # UTF-8이 아닌 파일(ArrowInvalid) 등은 아래 인코딩별 파싱으로 처리
+                    df = None
+            
+            # 실패 시 다양한 인코딩 시도 (업로드 바이트 재사용)
+            if df is None or len(df.columns) == 0 or df.empty:
+                encodings = ['cp949', 'euc-kr', 'utf-8', 'utf-8-sig', 'ansi']
+                
+                for encoding in encodings:
+                    try:
+                        df = pd.read_csv(BytesIO(file_bytes), encoding=encoding)
+                        successful_encoding = encoding
+                        # 컬럼이 제대로 파싱되었는지 확인
+                        if len(df.columns) > 0 and not df.empty:
+                            break
+                    except (UnicodeDecodeError, LookupError, pd.errors.EmptyDataError, pd.errors.ParserError):
+                        continue
             
             if df is None or len(df.columns) == 0:
                 st.error("CSV 파일을 읽을 수 없습니다. 파일 형식을 확인해주세요.")
-                return None
+                return None, None
                 
             st.success(f"파일이 {successful_encoding} 인코딩으로 성공적으로 로드되었습니다.")
             
-        elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(uploaded_file)
+        elif filename.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(BytesIO(file_bytes))
         else:
             st.error("지원하지 않는 파일 형식입니다. CSV 또는 Excel 파일을 업로드해주세요.")
-            return None
+            return None, None
         
         # 빈 DataFrame 체크
         if df.empty:
             st.error("파일이 비어있거나 데이터를 읽을 수 없습니다.")
-            return None
+            return None, None
         
         # 컬럼명 정리 (오타 수정 및 공백 제거)
         df.columns = df.columns.str.strip().str.replace('차변진액', '차변잔액')
         
-        # 계정코드를 문자열로 통일
+        # 계정코드를 문자열로 통일 후 범주형으로 변환 (비교/집계 시 정수 코드 사용)
         if '계정코드' in df.columns:
-            df['계정코드'] = df['계정코드'].astype(str).str.strip()
+            df['계정코드'] = df['계정코드'].astype(str).str.strip().astype('category')
         
         # 숫자형 컬럼 변환 및 결측치 처리
-        numeric_columns = ['차변잔액', '대변잔액', '차변금액', '대변금액']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        numeric_columns = [col for col in ['차변잔액', '대변잔액', '차변금액', '대변금액'] if col in df.columns]
+        if numeric_columns:
+            df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce').fillna(0).apply(_to_amount_dtype)
         
         # 데이터 로딩 정보 표시
         st.info(f"로드된 데이터: {len(df)}행, {len(df.columns)}열")
         st.write("컬럼명:", list(df.columns))
+        
+        # 계정코드 첫 자리 (계정 분류 판별용 내부 컬럼, 시나리오별 반복 문자열 연산 방지)
+        if '계정코드' in df.columns:
+            df['_acct_first'] = df['계정코드'].str[:1]
             
-        return df
+        return df, dataframe_digest(df)
     except Exception as e:
         st.error(f"파일 로딩 중 오류가 발생했습니다: {str(e)}")
-        return None
+        return None, None
+
+def load_data_file(uploaded_file):
+    """파일 업로드 및 데이터 로딩 함수 (DataFrame, 내용 해시값 반환)"""
+    return _load_data_impl(uploaded_file.getvalue(), uploaded_file.name)
+
+def strip_internal_columns(df):
+    """화면 표시용으로 내부 계산 컬럼(밑줄로 시작) 제거"""
+    internal_columns = [col for col in df.columns if str(col).startswith('_')]
+    return df.drop(columns=internal_columns) if internal_columns else df
 
 def validate_trial_balance(df):
     """시산표 데이터 유효성 검증"""
     required_columns = ['계정코드', '계정과목', '차변잔액', '대변잔액']
     
-    if not all(col in df.columns for col in required_columns):
-        missing_cols = [col for col in required_columns if col not in df.columns]
+    columns = df.columns
+    missing_cols = [col for col in required_columns if col not in columns]
+    if missing_cols:
         st.error(f"시산표에 필수 컬럼이 누락되었습니다: {missing_cols}")
         return False
     
@@ -89,8 +163,9 @@ def validate_journal_entries(df):
     """분개장 데이터 유효성 검증"""
     required_columns = ['전표일자', '전표번호', '계정코드', '계정과목', '차변금액', '대변금액']
     
-    if not all(col in df.columns for col in required_columns):
-        missing_cols = [col for col in required_columns if col not in df.columns]
+    columns = df.columns
+    missing_cols = [col for col in required_columns if col not in columns]
+    if missing_cols:
         st.error(f"분개장에 필수 컬럼이 누락되었습니다: {missing_cols}")
         return False
     
@@ -100,9 +175,11 @@ def scenario_a01_data_integrity(journal_df):
     """A01: 데이터 유효성 검증 및 레코드 이해 절차"""
     issues = []
     
-    # 1. 결측값 검사
-    missing_data = journal_df.isnull().sum()
-    if missing_data.any():
+    # 1. 결측값 검사 (필수 컬럼만 스캔)
+    required_columns = ['전표일자', '전표번호', '계정코드', '계정과목', '차변금액', '대변금액']
+    check_columns = [col for col in required_columns if col in journal_df.columns]
+    missing_data = journal_df[check_columns].isna().sum(axis=0)
+    if (missing_data > 0).any():
         issues.append(f"결측값 발견: {missing_data[missing_data > 0].to_dict()}")
     
     # 2. 중복 레코드 검사
@@ -114,7 +191,10 @@ def scenario_a01_data_integrity(journal_df):
     required_numeric = ['차변금액', '대변금액']
     for col in required_numeric:
         if col in journal_df.columns:
-            non_numeric = journal_df[col].apply(lambda x: not isinstance(x, (int, float, np.number))).sum()
+            # 로딩 단계에서 이미 숫자형으로 변환된 경우 행 단위 검사 생략
+            if pd.api.types.is_numeric_dtype(journal_df[col]):
+                continue
+            non_numeric = (pd.to_numeric(journal_df[col], errors='coerce').isna() & journal_df[col].notna()).sum()
             if non_numeric > 0:
                 issues.append(f"{col} 컬럼에 숫자가 아닌 값 {non_numeric}건 발견")
     
@@ -131,99 +211,181 @@ def scenario_a02_dr_cr_test(journal_df):
     if '전표번호' not in journal_df.columns:
         return ["전표번호 컬럼이 없어 검증할 수 없습니다."]
     
-    # 전표번호별 차변금액과 대변금액 합계 계산
-    voucher_summary = journal_df.groupby('전표번호').agg({
+    # 전표번호별 차대 순액 계산 (차변금액 - 대변금액 단일 컬럼 집계, float64로 계산)
+    diff = journal_df['차변금액'].astype(np.float64).sub(journal_df['대변금액'].astype(np.float64))
+    net = diff.groupby(journal_df['전표번호'].values, sort=False).sum()
+    
+    # 차변과 대변이 일치하지 않는 전표 찾기 (부동소수점 오차 허용)
+    bad = net[net.abs() > 0.01]
+    
+    if len(bad) == 0:
+        return []
+    
+    # 불일치 전표에 대해서만 차변/대변 합계 산출
+    unbalanced_rows = journal_df.loc[journal_df['전표번호'].isin(bad.index), ['전표번호', '차변금액', '대변금액']]
+    unbalanced = unbalanced_rows.astype({'차변금액': np.float64, '대변금액': np.float64}).groupby('전표번호', sort=False).agg({
         '차변금액': 'sum',
         '대변금액': 'sum'
     }).reset_index()
+    unbalanced['차이금액'] = unbalanced['전표번호'].map(bad)
+    return unbalanced
+
+def _rollforward_balances_numpy(dr_prev, cr_prev, dr_j, cr_j):
+    """전기잔액 + 당기 발생액으로 당기 차변/대변 잔액 계산 (NumPy 버전)"""
+    calc_dr = dr_prev + dr_j - cr_j
+    calc_cr = cr_prev + cr_j - dr_j
     
-    # 차변과 대변이 일치하지 않는 전표 찾기
-    unbalanced = voucher_summary[voucher_summary['차변금액'] != voucher_summary['대변금액']]
+    # 차변/대변 잔액 조정 (음수인 경우 반대편으로 이동)
+    negative_dr = calc_dr < 0
+    calc_cr = np.where(negative_dr, calc_cr - calc_dr, calc_cr)
+    calc_dr = np.where(negative_dr, 0.0, calc_dr)
     
-    if len(unbalanced) == 0:
-        return []
-    else:
-        unbalanced['차이금액'] = unbalanced['차변금액'] - unbalanced['대변금액']
-        return unbalanced
+    negative_cr = calc_cr < 0
+    calc_dr = np.where(negative_cr, calc_dr - calc_cr, calc_dr)
+    calc_cr = np.where(negative_cr, 0.0, calc_cr)
+    
+    return calc_dr, calc_cr
+
+_rollforward_balances = _rollforward_balances_numpy
+
+if NUMBA_AVAILABLE:
+    # cache=True는 캐시를 만든 모듈 이름(__main__/jet_automation)이 다르면
+    # 로딩 시 스크립트를 다시 import하므로 사용하지 않음 (컴파일은 프로세스당 1회)
+    @njit(fastmath=True)
+    def _rollforward_kernel(dr_prev, cr_prev, dr_j, cr_j, out_dr, out_cr):
+        for i in range(dr_prev.shape[0]):
+            d = dr_prev[i] + dr_j[i] - cr_j[i]
+            c = cr_prev[i] + cr_j[i] - dr_j[i]
+            if d < 0:
+                c += -d
+                d = 0.0
+            if c < 0:
+                d += -c
+                c = 0.0
+            out_dr[i] = d
+            out_cr[i] = c
+    
+    def _rollforward_balances_numba(dr_prev, cr_prev, dr_j, cr_j):
+        """전기잔액 + 당기 발생액으로 당기 차변/대변 잔액 계산 (Numba 버전)"""
+        out_dr = np.empty_like(dr_prev)
+        out_cr = np.empty_like(cr_prev)
+        try:
+            _rollforward_kernel(dr_prev, cr_prev, dr_j, cr_j, out_dr, out_cr)
+        except Exception:
+            # JIT 컴파일 실패 시 NumPy 버전으로 계산
+            return _rollforward_balances_numpy(dr_prev, cr_prev, dr_j, cr_j)
+        return out_dr, out_cr
+    
+    _rollforward_balances = _rollforward_balances_numba
+
+def _index_trial_balance(tb):
+    """시산표를 계정코드 인덱스로 변환 (중복 계정코드는 잔액 합산)"""
+    tb = tb[['계정코드', '계정과목', '차변잔액', '대변잔액']].astype({'차변잔액': np.float64, '대변잔액': np.float64})
+    tb = tb.set_index('계정코드')
+    tb.index = tb.index.astype(str)
+    if not tb.index.is_unique:
+        tb = tb.groupby(level=0, sort=False).agg({
+            '계정과목': 'first',
+            '차변잔액': 'sum',
+            '대변잔액': 'sum'
+        })
+    return tb
 
 def scenario_a03_rollforward_test(prev_tb, journal_df, curr_tb):
     """A03: 전표데이터 기반 시산표 재구성으로 완전성 검증"""
     if not all([prev_tb is not None, journal_df is not None, curr_tb is not None]):
         return None, "필요한 데이터가 모두 업로드되지 않았습니다."
     
+    # 잔액 컬럼은 로딩 단계(load_data_file)에서 숫자형으로 변환됨
+    for tb in (prev_tb, curr_tb):
+        if not all(pd.api.types.is_numeric_dtype(tb[col]) for col in ['차변잔액', '대변잔액']):
+            return None, "시산표 잔액 컬럼이 숫자형이 아닙니다."
+    
     try:
-        # 분개장에서 계정코드별 집계
-        journal_summary = journal_df.groupby('계정코드').agg({
-            '차변금액': 'sum',
-            '대변금액': 'sum'
-        }).reset_index()
-        
-        # 전기 시산표 준비
-        prev_tb_clean = prev_tb.copy()
-        prev_tb_clean['계정코드'] = prev_tb_clean['계정코드'].astype(str).str.strip()
-        prev_tb_clean['차변잔액'] = pd.to_numeric(prev_tb_clean['차변잔액'], errors='coerce').fillna(0)
-        prev_tb_clean['대변잔액'] = pd.to_numeric(prev_tb_clean['대변잔액'], errors='coerce').fillna(0)
-        
-        # 당기 시산표 준비
-        curr_tb_clean = curr_tb.copy()
-        curr_tb_clean['계정코드'] = curr_tb_clean['계정코드'].astype(str).str.strip()
-        curr_tb_clean['차변잔액'] = pd.to_numeric(curr_tb_clean['차변잔액'], errors='coerce').fillna(0)
-        curr_tb_clean['대변잔액'] = pd.to_numeric(curr_tb_clean['대변잔액'], errors='coerce').fillna(0)
-        
-        # 분개장 계정코드 정리
-        journal_summary['계정코드'] = journal_summary['계정코드'].astype(str).str.strip()
-        
-        # 전기 시산표와 분개장 합계 병합
-        merged = prev_tb_clean.merge(journal_summary, on='계정코드', how='outer', suffixes=('_prev', '_journal'))
-        
-        # 결측값을 0으로 처리
-        for col in ['차변잔액', '대변잔액', '차변금액', '대변금액']:
-            if col in merged.columns:
-                merged[col] = merged[col].fillna(0)
-        
-        # 계산된 당기 잔액 구하기
-        merged['계산된_차변잔액'] = merged['차변잔액'] + merged['차변금액'] - merged['대변금액']
-        merged['계산된_대변잔액'] = merged['대변잔액'] + merged['대변금액'] - merged['차변금액']
-        
-        # 차변/대변 잔액 조정 (음수인 경우 반대편으로 이동)
-        negative_dr_mask = merged['계산된_차변잔액'] < 0
-        merged.loc[negative_dr_mask, '계산된_대변잔액'] = merged.loc[negative_dr_mask, '계산된_대변잔액'] + abs(merged.loc[negative_dr_mask, '계산된_차변잔액'])
-        merged.loc[negative_dr_mask, '계산된_차변잔액'] = 0
+        # 분개장에서 계정코드별 집계 (계정코드 인덱스, float64로 합산)
+        journal_summary = journal_df[['차변금액', '대변금액']].astype(np.float64).groupby(
+            journal_df['계정코드'], sort=False, observed=True
+        ).sum()
+        journal_summary.index = journal_summary.index.astype(str)
+        
+        # 계정코드 순으로 정렬해 두면 두 경로 모두 합집합(정렬) 기준과 같은 순서로 출력
+        prev_by_account = _index_trial_balance(prev_tb).sort_index()
+        curr_by_account = _index_trial_balance(curr_tb).sort_index()
+        
+        if (prev_by_account.index.equals(curr_by_account.index)
+                and journal_summary.index.isin(prev_by_account.index).all()):
+            # 전기/당기 시산표 계정코드가 동일하고 분개장 계정이 모두 포함된 경우 (일반적인 경우)
+            # 합집합 구성 및 시산표 재정렬 생략
+            account_codes = prev_by_account.index
+            prev_aligned = prev_by_account
+            curr_aligned = curr_by_account
+            st.info("ℹ️ 전기/당기 시산표 계정코드 구성이 동일하여 시산표 기준으로 바로 Roll-forward를 계산했습니다.")
+        else:
+            # 세 데이터의 계정코드 합집합 기준으로 정렬 (병합 대신 reindex)
+            account_codes = prev_by_account.index.union(journal_summary.index).union(curr_by_account.index)
+            prev_aligned = prev_by_account.reindex(account_codes)
+            curr_aligned = curr_by_account.reindex(account_codes)
+            st.info("ℹ️ 시산표/분개장 계정코드 합집합 기준으로 Roll-forward를 계산했습니다.")
         
-        negative_cr_mask = merged['계산된_대변잔액'] < 0
-        merged.loc[negative_cr_mask, '계산된_차변잔액'] = merged.loc[negative_cr_mask, '계산된_차변잔액'] + abs(merged.loc[negative_cr_mask, '계산된_대변잔액'])
-        merged.loc[negative_cr_mask, '계산된_대변잔액'] = 0
+        journal_aligned = journal_summary.reindex(account_codes)
         
-        # 당기 시산표와 비교
-        comparison = merged.merge(curr_tb_clean, on='계정코드', how='outer', suffixes=('_calc', '_actual'))
+        # 결측값을 0으로 처리
+        dr_prev = prev_aligned['차변잔액'].fillna(0).to_numpy(np.float64)
+        cr_prev = prev_aligned['대변잔액'].fillna(0).to_numpy(np.float64)
+        dr_j = journal_aligned['차변금액'].fillna(0).to_numpy(np.float64)
+        cr_j = journal_aligned['대변금액'].fillna(0).to_numpy(np.float64)
+        dr_actual = curr_aligned['차변잔액'].fillna(0).to_numpy(np.float64)
+        cr_actual = curr_aligned['대변잔액'].fillna(0).to_numpy(np.float64)
         
-        # 결측값 처리
-        for col in ['계산된_차변잔액', '계산된_대변잔액', '차변잔액_actual', '대변잔액_actual']:
-            if col in comparison.columns:
-                comparison[col] = comparison[col].fillna(0)
+        # 계산된 당기 잔액 구하기 (음수 잔액은 반대편으로 이동)
+        calc_dr, calc_cr = _rollforward_balances(dr_prev, cr_prev, dr_j, cr_j)
         
         # 차이 계산
-        comparison['차변_차이'] = comparison['계산된_차변잔액'] - comparison['차변잔액_actual']
-        comparison['대변_차이'] = comparison['계산된_대변잔액'] - comparison['대변잔액_actual']
+        dr_diff = calc_dr - dr_actual
+        cr_diff = calc_cr - cr_actual
         
-        # 차이가 있는 항목만 필터링 (0.01원 이상 차이)
-        differences = comparison[(abs(comparison['차변_차이']) > 0.01) | (abs(comparison['대변_차이']) > 0.01)]
+        # 당기 시산표와 비교
+        comparison = pd.DataFrame({
+            '계정코드': account_codes,
+            '계정과목_prev': prev_aligned['계정과목'].to_numpy(),
+            '차변잔액_prev': dr_prev,
+            '대변잔액_prev': cr_prev,
+            '차변금액': dr_j,
+            '대변금액': cr_j,
+            '계산된_차변잔액': calc_dr,
+            '계산된_대변잔액': calc_cr,
+            '계정과목_actual': curr_aligned['계정과목'].to_numpy(),
+            '차변잔액_actual': dr_actual,
+            '대변잔액_actual': cr_actual,
+            '차변_차이': dr_diff,
+            '대변_차이': cr_diff
+        })
+        
+        # 차이가 있는 항목만 필터링 (허용 오차 초과, 차변/대변 중 큰 쪽 기준 단일 마스크)
+        diff_mask = np.maximum(np.abs(dr_diff), np.abs(cr_diff)) > 0.01
+        differences = comparison.iloc[diff_mask]
         
         return differences, None
         
     except Exception as e:
         return None, f"Roll-forward 테스트 중 오류 발생: {str(e)}"
 
+# 계정코드/사용자 패턴 검사용 정규식 (모듈 로딩 시 1회 컴파일)
+_ACCOUNT_CODE_RE = re.compile(r'[0-9A-Za-z]{3,10}')
+_SYSTEM_USER_RE = re.compile(r'SYSTEM|ADMIN|TEST|AUTO', re.IGNORECASE)
+_INAPPROPRIATE_USER_RE = re.compile(r'CEO|CFO|감사|외부|GUEST|임원', re.IGNORECASE)
+
 def scenario_b01_large_items_test(journal_df, materiality_threshold=1000000):
     """B01: 손익계정별 중요성금액 기준 분석"""
     # 손익계정 코드 패턴 (일반적으로 4로 시작하는 수익, 5로 시작하는 비용)
-    pl_accounts = journal_df[journal_df['계정코드'].astype(str).str.startswith(('4', '5'))]
+    pl_accounts = journal_df[journal_df['_acct_first'].isin(['4', '5'])]
     
     if len(pl_accounts) == 0:
         return pd.DataFrame(), "손익계정이 발견되지 않았습니다."
     
-    # 계정별 금액 집계
-    pl_summary = pl_accounts.groupby(['계정코드', '계정과목']).agg({
+    # 계정별 금액 집계 (float64로 합산)
+    pl_accounts = pl_accounts.astype({'차변금액': np.float64, '대변금액': np.float64})
+    pl_summary = pl_accounts.groupby(['계정코드', '계정과목'], sort=False, observed=True).agg({
         '차변금액': 'sum',
         '대변금액': 'sum'
     }).reset_index()
@@ -238,18 +400,15 @@ def scenario_b01_large_items_test(journal_df, materiality_threshold=1000000):
 def scenario_b02_unmatched_accounts(journal_df, chart_of_accounts=None):
     """B02: CoA 기준 비정상적인 계정 사용 전표 확인"""
     if chart_of_accounts is None:
-        # 기본적인 계정코드 패턴 검사
-        account_codes = journal_df['계정코드'].astype(str)
+        # 기본적인 계정코드 패턴 검사 (범주형 계정코드는 고유값에 대해서만 문자열 연산 수행)
+        account_codes = journal_df['계정코드']
         
         # 일반적이지 않은 패턴 (예: 너무 짧거나 긴 계정코드, 특수문자 포함)
-        unusual_patterns = account_codes[
-            (account_codes.str.len() < 3) | 
-            (account_codes.str.len() > 10) |
-            (~account_codes.str.match(r'^[0-9A-Za-z]+$', na=False))
-        ]
+        # 길이(3~10자)와 영숫자 조건을 단일 정규식으로 검사
+        unusual_mask = ~account_codes.str.fullmatch(_ACCOUNT_CODE_RE, na=False)
         
-        if len(unusual_patterns) > 0:
-            unmatched_entries = journal_df[journal_df['계정코드'].astype(str).isin(unusual_patterns)]
+        if unusual_mask.any():
+            unmatched_entries = journal_df[unusual_mask]
             return unmatched_entries
     
     return pd.DataFrame()
@@ -259,27 +418,16 @@ def scenario_b03_new_accounts(journal_df, prev_tb_df):
     if prev_tb_df is None:
         return pd.DataFrame(), "전기 시산표가 없어 신규 계정을 확인할 수 없습니다."
     
-    # 전기 시산표의 계정코드 목록
-    prev_accounts = set(prev_tb_df['계정코드'].astype(str))
-    
-    # 분개장의 계정코드 목록
-    current_accounts = set(journal_df['계정코드'].astype(str))
-    
-    # 신규 생성 계정코드
-    new_accounts = current_accounts - prev_accounts
-    
-    if len(new_accounts) == 0:
-        return pd.DataFrame(), None
-    
-    # 신규 계정을 사용한 전표 추출
-    new_account_entries = journal_df[journal_df['계정코드'].astype(str).isin(new_accounts)]
+    # 전기 시산표에 없는 계정코드를 사용한 전표 추출
+    new_mask = ~journal_df['계정코드'].isin(prev_tb_df['계정코드'])
+    new_account_entries = journal_df[new_mask]
     
     return new_account_entries, None
 
 def scenario_b04_seldom_used_accounts(journal_df, frequency_threshold=5):
     """B04: 저빈도 사용 계정 포함 전표 적정성 확인"""
     # 계정별 사용 빈도 계산
-    account_frequency = journal_df['계정코드'].value_counts()
+    account_frequency = journal_df['계정코드'].value_counts(sort=False)
     
     # 저빈도 사용 계정 (threshold 이하)
     seldom_used = account_frequency[account_frequency <= frequency_threshold].index
@@ -297,29 +445,26 @@ def scenario_b05_unusual_user(journal_df, authorized_users=None):
     if '입력사원' not in journal_df.columns:
         return pd.DataFrame(), "입력사원 컬럼이 없어 분석할 수 없습니다."
     
+    users = journal_df['입력사원']
+    
     # 기본 승인된 사용자 목록 (실제로는 인사 시스템에서 가져와야 함)
     if authorized_users is None:
         # 사용자 패턴 분석으로 일반적이지 않은 사용자 찾기
-        user_counts = journal_df['입력사원'].value_counts()
-        
         # 매우 적게 사용한 사용자들 (1-2회만 사용)
-        unusual_users = user_counts[user_counts <= 2].index
+        rare_mask = users.map(users.value_counts(sort=False)).le(2)
         
         # 시스템 계정으로 보이는 사용자 (예: SYSTEM, ADMIN 등)
-        system_pattern_users = journal_df[
-            journal_df['입력사원'].astype(str).str.contains('SYSTEM|ADMIN|TEST|AUTO', case=False, na=False)
-        ]['입력사원'].unique()
+        system_mask = users.astype(str).str.contains(_SYSTEM_USER_RE, na=False)
         
-        all_unusual = list(unusual_users) + list(system_pattern_users)
+        unusual_mask = rare_mask | system_mask
     else:
         # 승인된 사용자 목록에 없는 사용자
-        all_users = journal_df['입력사원'].unique()
-        all_unusual = [user for user in all_users if user not in authorized_users]
+        unusual_mask = ~users.isin(authorized_users)
     
-    if len(all_unusual) == 0:
+    if not unusual_mask.any():
         return pd.DataFrame(), None
     
-    unusual_entries = journal_df[journal_df['입력사원'].isin(all_unusual)]
+    unusual_entries = journal_df[unusual_mask]
     
     return unusual_entries, None
 
@@ -330,16 +475,10 @@ def scenario_b06_inappropriate_user(journal_df, user_roles=None):
     
     # 실제로는 권한 시스템에서 가져와야 하지만, 여기서는 패턴으로 분석
     if user_roles is None:
-        # 일반적으로 입력권한이 없을 것으로 보이는 사용자 패턴
+        # 일반적으로 입력권한이 없을 것으로 보이는 사용자 패턴 (단일 정규식으로 1회 스캔)
         # 예: 임원, 감사, 외부 등
-        inappropriate_patterns = ['CEO', 'CFO', '감사', '외부', 'GUEST', '임원']
-        
-        inappropriate_users = []
-        for pattern in inappropriate_patterns:
-            pattern_users = journal_df[
-                journal_df['입력사원'].astype(str).str.contains(pattern, case=False, na=False)
-            ]['입력사원'].unique()
-            inappropriate_users.extend(pattern_users)
+        pattern_mask = journal_df['입력사원'].astype(str).str.contains(_INAPPROPRIATE_USER_RE, na=False)
+        inappropriate_users = journal_df.loc[pattern_mask, '입력사원'].unique()
     else:
         # 권한이 없는 사용자 목록에서 실제로 입력한 사용자 찾기
         inappropriate_users = [user for user in journal_df['입력사원'].unique() 
@@ -386,55 +525,61 @@ def scenario_b08_create_approve_same(journal_df):
 
 def scenario_b09_corresponding_accounts(journal_df):
     """B09: 비정상적인 계정 조합 전표 추출"""
-    # 전표번호별로 그룹화하여 계정 조합 분석
-    voucher_groups = journal_df.groupby('전표번호')
-    
-    unusual_combinations = []
-    
-    for voucher_no, group in voucher_groups:
-        accounts = group['계정코드'].astype(str).tolist()
-        account_names = group['계정과목'].tolist()
-        
-        # 비정상적인 조합 패턴 검사
-        # 1. 현금과 현금 간의 거래 (예: 현금 -> 현금)
-        cash_accounts = ['101', '102', '103']  # 일반적인 현금성 자산 계정
-        cash_in_voucher = [acc for acc in accounts if acc.startswith(tuple(cash_accounts))]
-        
-        if len(cash_in_voucher) >= 2:
-            unusual_combinations.append({
-                '전표번호': voucher_no,
-                '문제유형': '현금-현금 거래',
-                '관련계정': ', '.join(cash_in_voucher),
-                '거래내역': group
-            })
-        
-        # 2. 자산과 부채의 직접적인 상계
-        assets = [acc for acc in accounts if acc.startswith(('1', '2'))]  # 자산: 1, 투자자산: 2
-        liabilities = [acc for acc in accounts if acc.startswith('3')]  # 부채: 3
-        
-        if len(assets) > 0 and len(liabilities) > 0 and len(group) == 2:
-            # 단순한 자산-부채 직접 상계 (수익/비용 없이)
-            revenue_expense = [acc for acc in accounts if acc.startswith(('4', '5'))]
-            if len(revenue_expense) == 0:
-                unusual_combinations.append({
-                    '전표번호': voucher_no,
-                    '문제유형': '자산-부채 직접상계',
-                    '관련계정': ', '.join(accounts),
-                    '거래내역': group
-                })
-    
-    if len(unusual_combinations) == 0:
+    voucher_no = journal_df['전표번호']
+    
+    # 계정 분류 (자산: 1, 투자자산: 2 / 부채: 3 / 수익: 4 / 비용: 5)
+    acct_class = journal_df['_acct_first'].map({'1': 'A', '2': 'A', '3': 'L', '4': 'R', '5': 'E'}).fillna('O')
+    
+    # 일반적인 현금성 자산 계정
+    cash_accounts = ['101', '102', '103']
+    is_cash = journal_df['계정코드'].str[:3].isin(cash_accounts)
+    
+    # 전표번호별 계정 조합 플래그 집계
+    voucher_groups = voucher_no.groupby(voucher_no, sort=False)
+    cash_count = is_cash.groupby(voucher_no, sort=False).sum()
+    has_assets = acct_class.eq('A').groupby(voucher_no, sort=False).any()
+    has_liabilities = acct_class.eq('L').groupby(voucher_no, sort=False).any()
+    has_revenue_expense = acct_class.isin(['R', 'E']).groupby(voucher_no, sort=False).any()
+    row_count = voucher_groups.size()
+    
+    # 비정상적인 조합 패턴 검사
+    # 1. 현금과 현금 간의 거래 (예: 현금 -> 현금)
+    cash_vouchers = cash_count.index[cash_count >= 2]
+    
+    # 2. 자산과 부채의 직접적인 상계 (수익/비용 없이 2줄로 구성된 전표)
+    offset_mask = has_assets & has_liabilities & ~has_revenue_expense & (row_count == 2)
+    offset_vouchers = offset_mask.index[offset_mask]
+    
+    if len(cash_vouchers) == 0 and len(offset_vouchers) == 0:
         return pd.DataFrame(), None
     
-    # 결과를 DataFrame으로 변환
-    result_df = pd.DataFrame()
-    for combo in unusual_combinations:
-        combo_df = combo['거래내역'].copy()
-        combo_df['문제유형'] = combo['문제유형']
-        result_df = pd.concat([result_df, combo_df], ignore_index=True)
+    # 해당 행 위치와 문제유형 코드만 수집 후 결과를 한 번에 구성
+    cash_rows = np.flatnonzero(voucher_no.isin(cash_vouchers).to_numpy())
+    offset_rows = np.flatnonzero(voucher_no.isin(offset_vouchers).to_numpy())
+    bad_idx = np.concatenate([cash_rows, offset_rows])
+    codes = np.concatenate([
+        np.zeros(len(cash_rows), dtype=np.int8),
+        np.ones(len(offset_rows), dtype=np.int8)
+    ])
+    
+    # 전표번호 순 정렬 (동일 전표 내에서는 현금-현금 거래 우선)
+    # factorize 순위 코드로 정렬하여 숫자/문자 혼합 전표번호(Excel 업로드)도 처리
+    voucher_rank = pd.factorize(voucher_no, sort=True)[0]
+    order = np.argsort(voucher_rank[bad_idx], kind='stable')
+    result_df = journal_df.take(bad_idx[order]).reset_index(drop=True)
+    result_df['문제유형'] = pd.Categorical.from_codes(codes[order], categories=['현금-현금 거래', '자산-부채 직접상계'])
     
     return result_df, None
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def _run_scenario_cached(scenario_name, data_digests, params, _scenario_func, _data):
+    """입력 데이터 해시와 파라미터 기준으로 캐시되는 시나리오 실행 함수"""
+    return _scenario_func(*_data, *params)
+
+def run_scenario(scenario_func, data, data_digests, *params):
+    """시나리오 실행 (입력 데이터와 파라미터가 같으면 위젯 변경 시 재계산 생략)"""
+    return _run_scenario_cached(scenario_func.__name__, tuple(data_digests), params, scenario_func, tuple(data))
+
 # Streamlit UI
 st.title("📊 회계감사 JET(Journal Entry Testing) 자동화 프로그램")
 st.markdown("---")
@@ -487,9 +632,10 @@ with col1:
     st.header("📈 분석 결과")
     
     # 데이터 로딩
-    prev_tb_df = load_data_file(prev_tb_file) if prev_tb_file else None
-    journal_df = load_data_file(journal_file) if journal_file else None
-    curr_tb_df = load_data_file(curr_tb_file) if curr_tb_file else None
+    # 데이터 내용 해시값은 시나리오 결과 캐시 키로 사용 (로딩 캐시와 함께 1회만 계산)
+    prev_tb_df, prev_tb_digest = load_data_file(prev_tb_file) if prev_tb_file else (None, None)
+    journal_df, journal_digest = load_data_file(journal_file) if journal_file else (None, None)
+    curr_tb_df, curr_tb_digest = load_data_file(curr_tb_file) if curr_tb_file else (None, None)
     
     if journal_df is not None and validate_journal_entries(journal_df):
         
@@ -497,7 +643,7 @@ with col1:
         if scenario_a01:
             with st.expander("🔍 A01: 데이터 유효성 검증 결과", expanded=True):
                 with st.spinner("데이터 유효성을 검증하는 중..."):
-                    integrity_issues = scenario_a01_data_integrity(journal_df)
+                    integrity_issues = run_scenario(scenario_a01_data_integrity, (journal_df,), (journal_digest,))
                     
                     if not integrity_issues:
                         st.success("✅ 데이터 유효성 검증 통과: 발견된 문제가 없습니다.")
@@ -510,7 +656,7 @@ with col1:
         if scenario_a02:
             with st.expander("⚖️ A02: 전표 차대평형 검증 결과", expanded=True):
                 with st.spinner("전표별 차대평형을 검증하는 중..."):
-                    unbalanced_vouchers = scenario_a02_dr_cr_test(journal_df)
+                    unbalanced_vouchers = run_scenario(scenario_a02_dr_cr_test, (journal_df,), (journal_digest,))
                     
                     if isinstance(unbalanced_vouchers, list) and not unbalanced_vouchers:
                         st.success("✅ 전표 차대평형 검증 통과: 모든 전표의 차변과 대변이 일치합니다.")
@@ -526,7 +672,11 @@ with col1:
                 if prev_tb_df is not None and curr_tb_df is not None:
                     if validate_trial_balance(prev_tb_df) and validate_trial_balance(curr_tb_df):
                         with st.spinner("시산표 Roll-forward를 검증하는 중..."):
-                            differences, error_msg = scenario_a03_rollforward_test(prev_tb_df, journal_df, curr_tb_df)
+                            differences, error_msg = run_scenario(
+                                scenario_a03_rollforward_test,
+                                (prev_tb_df, journal_df, curr_tb_df),
+                                (prev_tb_digest, journal_digest, curr_tb_digest)
+                            )
                             
                             if error_msg:
                                 st.error(f"❌ {error_msg}")
@@ -553,7 +703,7 @@ with col1:
         if scenario_b01:
             with st.expander("💰 B01: 손익계정 중요성금액 분석 결과", expanded=False):
                 with st.spinner("손익계정을 분석하는 중..."):
-                    large_items, error_msg = scenario_b01_large_items_test(journal_df, materiality)
+                    large_items, error_msg = run_scenario(scenario_b01_large_items_test, (journal_df,), (journal_digest,), materiality)
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -567,19 +717,21 @@ with col1:
         if scenario_b02:
             with st.expander("🚨 B02: 비정상 계정 사용 검사 결과", expanded=False):
                 with st.spinner("비정상 계정 사용을 검사하는 중..."):
-                    unmatched_accounts = scenario_b02_unmatched_accounts(journal_df)
+                    unmatched_accounts = run_scenario(scenario_b02_unmatched_accounts, (journal_df,), (journal_digest,))
                     
                     if len(unmatched_accounts) == 0:
                         st.success("✅ 비정상적인 계정 사용이 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 비정상적인 계정 사용 {len(unmatched_accounts)}건 발견")
-                        st.dataframe(unmatched_accounts)
+                        st.dataframe(strip_internal_columns(unmatched_accounts))
         
         # B03: 신규 생성 계정과목 검사
         if scenario_b03:
             with st.expander("🆕 B03: 신규 생성 계정과목 검사 결과", expanded=False):
                 with st.spinner("신규 계정과목을 분석하는 중..."):
-                    new_account_entries, error_msg = scenario_b03_new_accounts(journal_df, prev_tb_df)
+                    new_account_entries, error_msg = run_scenario(
+                        scenario_b03_new_accounts, (journal_df, prev_tb_df), (journal_digest, prev_tb_digest)
+                    )
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -587,13 +739,13 @@ with col1:
                         st.success("✅ 신규 생성 계정과목이 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 신규 계정과목 사용 전표 {len(new_account_entries)}건 발견")
-                        st.dataframe(new_account_entries)
+                        st.dataframe(strip_internal_columns(new_account_entries))
         
         # B04: 저빈도 사용 계정 검사
         if scenario_b04:
             with st.expander("🔍 B04: 저빈도 사용 계정 검사 결과", expanded=False):
                 with st.spinner("저빈도 사용 계정을 분석하는 중..."):
-                    seldom_entries, error_msg = scenario_b04_seldom_used_accounts(journal_df, frequency_threshold)
+                    seldom_entries, error_msg = run_scenario(scenario_b04_seldom_used_accounts, (journal_df,), (journal_digest,), frequency_threshold)
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -601,13 +753,13 @@ with col1:
                         st.success(f"✅ 저빈도({frequency_threshold}회 이하) 사용 계정이 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 저빈도 사용 계정 전표 {len(seldom_entries)}건 발견")
-                        st.dataframe(seldom_entries)
+                        st.dataframe(strip_internal_columns(seldom_entries))
         
         # B05: 비정상 사용자 검사
         if scenario_b05:
             with st.expander("👤 B05: 비정상 사용자 검사 결과", expanded=False):
                 with st.spinner("비정상 사용자를 분석하는 중..."):
-                    unusual_entries, error_msg = scenario_b05_unusual_user(journal_df)
+                    unusual_entries, error_msg = run_scenario(scenario_b05_unusual_user, (journal_df,), (journal_digest,))
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -615,13 +767,13 @@ with col1:
                         st.success("✅ 비정상적인 사용자가 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 비정상 사용자 전표 {len(unusual_entries)}건 발견")
-                        st.dataframe(unusual_entries)
+                        st.dataframe(strip_internal_columns(unusual_entries))
         
         # B06: 권한 없는 사용자 검사
         if scenario_b06:
             with st.expander("🚫 B06: 권한 없는 사용자 검사 결과", expanded=False):
                 with st.spinner("권한 없는 사용자를 분석하는 중..."):
-                    inappropriate_entries, error_msg = scenario_b06_inappropriate_user(journal_df)
+                    inappropriate_entries, error_msg = run_scenario(scenario_b06_inappropriate_user, (journal_df,), (journal_digest,))
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -629,13 +781,13 @@ with col1:
                         st.success("✅ 권한 없는 사용자가 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 권한 없는 사용자 전표 {len(inappropriate_entries)}건 발견")
-                        st.dataframe(inappropriate_entries)
+                        st.dataframe(strip_internal_columns(inappropriate_entries))
         
         # B07: 기표일 이후 입력 전표 분석
         if scenario_b07:
             with st.expander("📅 B07: 기표일 이후 입력 전표 분석 결과", expanded=False):
                 with st.spinner("기표일 이후 입력 전표를 분석하는 중..."):
-                    back_dated, error_msg = scenario_b07_back_dated_entries(journal_df, fiscal_year_end)
+                    back_dated, error_msg = run_scenario(scenario_b07_back_dated_entries, (journal_df,), (journal_digest,), fiscal_year_end)
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -643,13 +795,13 @@ with col1:
                         st.success("✅ 결산일 이후 입력된 전표가 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 결산일 이후 입력된 전표 {len(back_dated)}건 발견")
-                        st.dataframe(back_dated)
+                        st.dataframe(strip_internal_columns(back_dated))
         
         # B08: 입력자-승인자 동일 검사
         if scenario_b08:
             with st.expander("👥 B08: 입력자-승인자 동일 검사 결과", expanded=False):
                 with st.spinner("입력자와 승인자를 분석하는 중..."):
-                    same_user_entries, error_msg = scenario_b08_create_approve_same(journal_df)
+                    same_user_entries, error_msg = run_scenario(scenario_b08_create_approve_same, (journal_df,), (journal_digest,))
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -657,13 +809,13 @@ with col1:
                         st.success("✅ 입력자와 승인자가 동일한 전표가 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 입력자-승인자 동일 전표 {len(same_user_entries)}건 발견")
-                        st.dataframe(same_user_entries)
+                        st.dataframe(strip_internal_columns(same_user_entries))
         
         # B09: 비정상 계정 조합 검사
         if scenario_b09:
             with st.expander("🔗 B09: 비정상 계정 조합 검사 결과", expanded=False):
                 with st.spinner("비정상 계정 조합을 분석하는 중..."):
-                    unusual_combinations, error_msg = scenario_b09_corresponding_accounts(journal_df)
+                    unusual_combinations, error_msg = run_scenario(scenario_b09_corresponding_accounts, (journal_df,), (journal_digest,))
                     
                     if error_msg:
                         st.warning(f"⚠️ {error_msg}")
@@ -671,7 +823,7 @@ with col1:
                         st.success("✅ 비정상적인 계정 조합이 발견되지 않았습니다.")
                     else:
                         st.warning(f"⚠️ 비정상 계정 조합 전표 {len(unusual_combinations)}건 발견")
-                        st.dataframe(unusual_combinations)
+                        st.dataframe(strip_internal_columns(unusual_combinations))
     
     else:
         st.info("📁 분개장 파일을 업로드하고 시나리오를 선택해주세요.")